@@ -27,4 +27,27 @@ test_example palindrome 'Good'
 test_example incorrect "Input 'bb' should be accepted."
 test_example missing-final-states 'missing final state declaration'
 
+test_bundle() {
+    input="$1"
+    expected="$2"
+    echo -n "test $input (bundled) ... "
+    make --silent "examples/$input.bundle.py"
+    answer="$(mktemp)"
+    python3 -c 'import sys; print(open(sys.argv[1]).read().split("---")[2])' \
+        "examples/$input.txt" > "$answer"
+    output="$("./examples/$input.bundle.py" "$answer")"
+    rm -f "$answer" "examples/$input.bundle.py"
+    if [ "$output" = "$expected" ]
+    then
+        echo 'ok'
+    else
+        echo 'FAILED'
+        echo "\t(expected \"$expected\", got \"$output\")"
+        status=1
+    fi
+}
+
+test_bundle palindrome 'Good'
+test_bundle incorrect "Input 'bb' should be accepted."
+
 exit $status
@@ -0,0 +1,76 @@
+"""Build a self-contained grader for a single question.
+
+A bundle holds the grader precompiled to bytecode, along with the
+question's options, test suite and correct answer already parsed. This
+saves the quiz server from recompiling and reparsing everything on
+every submission.
+
+Usage:
+
+    python3 -m pda.bundle GRADER QUESTION_FILE > BUNDLE
+
+where ``GRADER`` is the merged script (``run_pda.py``), and
+``QUESTION_FILE`` holds the options and correct answer, separated by
+``---``.
+"""
+
+from base64 import b64encode
+import marshal
+import sys
+
+from .driver import prepare_question
+
+
+# Everything is embedded in base64, so that the quiz server's template
+# engine doesn't mistake any of it for a placeholder
+BUNDLE_TEMPLATE = '''#!/usr/bin/env python3
+from base64 import b64decode
+import marshal
+import sys
+
+CACHE_TAG = {cache_tag!r}
+CODE = {code!r}
+SOURCE = {source!r}
+QUESTION = {question!r}
+
+if sys.implementation.cache_tag == CACHE_TAG:
+    code = marshal.loads(b64decode(CODE))
+else:
+    # The bytecode is for a different interpreter, so compile from source
+    code = compile(b64decode(SOURCE), {filename!r}, 'exec')
+grader = {{'__name__': 'grader'}}
+exec(code, grader)
+
+if len(sys.argv) == 1:
+    # If no command line arguments are given, assume we're on the server
+    student_answer = """{{{{ STUDENT_ANSWER | e('py') }}}}"""
+elif len(sys.argv) == 2:
+    # Read the student's answer from the given file
+    student_answer = open(sys.argv[1]).read()
+else:
+    raise SystemExit('Usage: {{}} [ANSWER_FILE]'.format(sys.argv[0]))
+
+print(grader['grade_question'](marshal.loads(b64decode(QUESTION)), student_answer))
+'''
+
+
+def make_bundle(source, filename, option_str, correct_answer):
+    """Return the source of a bundle that grades answers to the given
+    question, using the grader in ``source``."""
+    code = compile(source, filename, 'exec')
+    question = prepare_question(option_str, correct_answer)
+    return BUNDLE_TEMPLATE.format(
+            cache_tag=sys.implementation.cache_tag,
+            code=b64encode(marshal.dumps(code)),
+            source=b64encode(source.encode('utf-8')),
+            question=b64encode(marshal.dumps(question)),
+            filename=filename)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        raise SystemExit('Usage: {} GRADER QUESTION_FILE'.format(sys.argv[0]))
+    grader, question_file = sys.argv[1:]
+    option_str, correct_answer = open(question_file).read().split('---')[:2]
+    sys.stdout.write(make_bundle(open(grader).read(), grader,
+            option_str, correct_answer))
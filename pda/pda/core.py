@@ -93,8 +93,9 @@ class PDA:
 class PDASimulator:
     """Simulates a PDA over a specific input string.
 
-    Use ``run()`` to drive the PDA to completion, or ``step()`` to run
-    it one step at a time.
+    Use ``run()`` to drive the PDA to completion, ``run_slice()`` to run
+    it a bounded number of steps at a time, or ``step()`` to run it one
+    step at a time.
     """
 
     def __init__(self, automaton, input,
@@ -112,6 +113,7 @@ class PDASimulator:
 
         # Initial state is assumed to be q0
         self.data = frozenset({Config(0, input, automaton.initial_stack)})
+        self.steps = 0
 
         self.max_iterations = max_iterations
         self.max_configs = max_configs
@@ -126,16 +128,32 @@ class PDASimulator:
         Return True if it accepts, False if it rejects, or raise
         RuntimeError if it breaks any execution limit.
         """
+        return self.run_slice(None)
 
-        iterations = range(self.max_iterations) if self.max_iterations else count()
+    def run_slice(self, steps):
+        """Run the PDA for at most ``steps`` steps, or to completion if
+        ``steps`` is None. The simulation can be resumed by calling this
+        method again.
+
+        Return True if it accepts, False if it rejects, or None if it
+        hasn't finished yet. Raise RuntimeError if it breaks any
+        execution limit.
+        """
+        iterations = range(steps) if steps is not None else count()
         for i in iterations:
+            if self.max_iterations and self.steps >= self.max_iterations:
+                raise RuntimeError('iteration limit reached (is there an infinite loop?)')
             if self.accepts():
                 return True
             if self.rejects():
                 return False
             self.step()
-        else:
-            raise RuntimeError('iteration limit reached (is there an infinite loop?)')
+        return None
+
+    def footprint(self):
+        """Return the number of symbols held across all configurations,
+        as a rough measure of memory use."""
+        return sum(len(config.input) + len(config.stack) for config in self.data)
 
     def accepts(self):
         """Return True if the PDA is in an accepting state."""
@@ -168,6 +186,7 @@ class PDASimulator:
                 any(len(config.stack) > self.max_stack_size for config in new_data)):
             raise RuntimeError('stack too large')
         self.data = new_data
+        self.steps += 1
 
     def _next_configs(self):
         """Generate all the configurations that can be reached by a
@@ -1,3 +1,7 @@
+from functools import lru_cache
+import json
+import mmap
+
 from .core import *
 from .parser import *
 
@@ -18,6 +22,8 @@ def parse_options(option_str):
     test_options = dict(
             use_student_answer=False,
             tests=None,
+            tests_file=None,
+            results_file=None,
             )
 
     options = {}
@@ -27,7 +33,10 @@ def parse_options(option_str):
 
     exec(option_str, globals(), options)
 
-    if options['tests'] is None:
+    if options['tests_file'] is not None:
+        # Stream the tests from disk, rather than loading them all
+        options['tests'] = read_corpus(options['tests_file'])
+    elif options['tests'] is None:
         # If the question writer didn't set any tests,
         # generate a default set from the input alphabet
         options['tests'] = \
@@ -52,13 +61,19 @@ def parse_automaton(pda_str, build_options, exec_options):
     """Parse a string describing a PDA.
 
     Return a function which, when called with an input string, runs the
-    PDA and returns the result.
+    PDA and returns a pair (result, steps).
     """
     table, final_states = parse_transition_table(pda_str)
+    return load_automaton(table, final_states, build_options, exec_options)
+
+
+def load_automaton(table, final_states, build_options, exec_options):
+    """Like ``parse_automaton``, but for a transition table that has
+    already been parsed."""
     automaton = PDA(table=table, final_states=final_states, **build_options)
     def run(input):
         simulator = PDASimulator(automaton, input, **exec_options)
-        return simulator.run()
+        return (simulator.run(), simulator.steps)
     return run
 
 
@@ -79,22 +94,270 @@ def strings_of_length(upto, alpha):
     return result
 
 
+def read_corpus(path):
+    """Yield the strings in a test corpus file, one per line.
+
+    The file is memory-mapped and read lazily, so it may be much larger
+    than would comfortably fit in a list. A blank line stands for the
+    empty string.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped, but they have no tests anyway
+            return
+        with data:
+            for line in iter(data.readline, b''):
+                yield line.rstrip(b'\r\n').decode('utf-8')
+
+
+def evaluate_tests(run_student, run_correct, tests):
+    """Run the student's PDA against the correct one on every string in
+    ``tests``, yielding the result of ``check_input`` for each.
+    """
+    for string in tests:
+        yield check_input(run_student, run_correct, string)
+
+
+def check_input(run_student, run_correct, string):
+    """Run the student's PDA against the correct one on a single string.
+
+    Return a dictionary giving the verdict (``'pass'``, ``'fail'``,
+    ``'limit'`` or ``'error'``), the number of steps the student's PDA
+    took, and the reason for failure (or None).
+    """
+    try:
+        student_accepts, steps = run_student(string)
+    except Exception as e:
+        return failed_run(string, e)
+    correct_accepts, _ = run_correct(string)
+    return compare_answers(string, student_accepts, correct_accepts, steps)
+
+
+def failed_run(string, error):
+    """Return the result for a student's PDA which raised ``error``
+    on ``string``."""
+    if isinstance(error, RuntimeError):
+        return dict(input=string, verdict='limit', steps=None,
+                reason="On input {!r}: {}".format(string, error))
+    else:
+        return dict(input=string, verdict='error', steps=None,
+                reason="There's an error in the automata representation.")
+
+
+def compare_answers(string, student_accepts, correct_accepts, steps):
+    """Return the result for a student's PDA which ran to completion on
+    ``string``."""
+    if student_accepts and not correct_accepts:
+        reason = "Input {!r} should be rejected.".format(string)
+    elif not student_accepts and correct_accepts:
+        reason = "Input {!r} should be accepted.".format(string)
+    else:
+        reason = None
+    return dict(input=string, verdict='pass' if reason is None else 'fail',
+            steps=steps, reason=reason)
+
+
 def run_tests(run_student, run_correct, options):
-    for string in options['tests']:
+    """Return the reason for the first failing test, or "Good" if
+    everything passes.
+
+    If the ``results_file`` option is set, every test is run regardless,
+    and the result for each is written to that file as a line of JSON.
+    """
+    results = evaluate_tests(run_student, run_correct, options['tests'])
+    if options['results_file'] is None:
+        for result in results:
+            if result['reason'] is not None:
+                return result['reason']
+        return "Good"
+    first_failure = None
+    with open(options['results_file'], 'w') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+            if first_failure is None:
+                first_failure = result['reason']
+    return first_failure or "Good"
+
+
+def run_cohort(run_students, run_correct, options, names=None):
+    """Grade many students' PDAs against the same tests in a single pass.
+
+    The tests are read once, and the correct PDA is run once per string
+    and shared between students. If ``run_correct`` is None, each
+    student's PDA is compared against itself.
+
+    If the ``results_file`` option is set, every student is run on every
+    test, and each result is written to that file as a line of JSON.
+    Its ``student`` field is taken from ``names``, which defaults to the
+    student's position in ``run_students``.
+
+    Return a list with the result of ``run_tests`` for each student.
+    """
+    if names is None:
+        names = list(range(len(run_students)))
+    if run_correct is not None:
+        # Every student is checked against the same string in turn, so
+        # remembering the last answer is enough
+        run_correct = lru_cache(maxsize=1)(run_correct)
+    verdicts = [None] * len(run_students)
+    pending = dict(enumerate(run_students))
+    results = None
+    if options['results_file'] is not None:
+        results = open(options['results_file'], 'w')
+    try:
+        for string in options['tests']:
+            if not pending:
+                break
+            for index, run_student in list(pending.items()):
+                result = check_input(run_student, run_correct or run_student, string)
+                if results is not None:
+                    result['student'] = names[index]
+                    results.write(json.dumps(result) + '\n')
+                if result['reason'] is not None:
+                    if verdicts[index] is None:
+                        verdicts[index] = result['reason']
+                    if results is None:
+                        # The first failure is all we need to report
+                        del pending[index]
+    finally:
+        if results is not None:
+            results.close()
+    return [verdict or "Good" for verdict in verdicts]
+
+
+def grade_cohort(option_str, correct_answer, student_answers, names=None):
+    """Parse the options and correct answer once, then grade every
+    answer in ``student_answers`` against them. ``names`` identifies
+    each student in the ``results_file``, as for ``run_cohort``.
+
+    Return a list of verdicts, one for each student.
+    """
+    if names is None:
+        names = list(range(len(student_answers)))
+    build_options, exec_options, test_options = parse_options(option_str)
+
+    verdicts = [None] * len(student_answers)
+    run_students = {}
+    for index, student_answer in enumerate(student_answers):
         try:
-            student_accepts = run_student(string)
-        except RuntimeError as e:
-            return "On input {!r}: {}".format(string, e)
+            run_students[index] = parse_automaton(
+                    student_answer, build_options, exec_options)
         except Exception as e:
-            return "There's an error in the automata representation."
-        correct_accepts = run_correct(string)
-        if student_accepts and not correct_accepts:
-            return "Input {!r} should be rejected.".format(string)
-        elif not student_accepts and correct_accepts:
-            return "Input {!r} should be accepted.".format(string)
+            verdicts[index] = str(e)
+
+    if test_options['use_student_answer']:
+        run_correct = None
+    else:
+        run_correct = parse_automaton(correct_answer, build_options, exec_options)
+
+    indices = sorted(run_students)
+    results = run_cohort([run_students[index] for index in indices],
+            run_correct, test_options, [names[index] for index in indices])
+    for index, verdict in zip(indices, results):
+        verdicts[index] = verdict
+    return verdicts
+
+
+def prepare_question(option_str, correct_answer):
+    """Parse the options and correct answer for a question.
+
+    The result contains only plain data (dicts, tuples, sets and
+    strings), so it can be serialised with ``marshal`` and embedded in a
+    bundle. Pass it to ``grade_question`` to grade a student's answer.
+    """
+    build_options, exec_options, test_options = parse_options(option_str)
+    if test_options['tests_file'] is not None:
+        # The corpus is streamed when grading, not stored in the question
+        test_options['tests'] = None
+    else:
+        test_options['tests'] = list(test_options['tests'])
+    if test_options['use_student_answer']:
+        reference = None
+    else:
+        reference = parse_transition_table(correct_answer)
+    return (build_options, exec_options, test_options, reference)
+
+
+def grade_question(question, student_answer):
+    """Grade a student's answer against a question returned by
+    ``prepare_question``, and return the verdict."""
+    build_options, exec_options, test_options, reference = question
+    if test_options['tests_file'] is not None:
+        test_options['tests'] = read_corpus(test_options['tests_file'])
+
+    # Parse the PDAs
+    try:
+        run_student = parse_automaton(student_answer, build_options, exec_options)
+    except Exception as e:
+        return str(e)
+
+    if reference is None:
+        run_correct = run_student
+    else:
+        run_correct = load_automaton(reference[0], reference[1],
+                build_options, exec_options)
+
+    # If everything's okay, run the tests
+    return run_tests(run_student, run_correct, test_options)
+
+
+def grade_question_in_slices(question, student_answer, slice_size=10):
+    """Like ``grade_question``, but as a generator which runs the PDAs
+    at most ``slice_size`` steps at a time.
+
+    A single step of a nondeterministic PDA can touch thousands of
+    configurations, so the slices are kept short.
+
+    After each slice, yield the footprint of the running simulation (see
+    ``PDASimulator.footprint``). The verdict is the generator's return
+    value. Unlike ``grade_question``, this stops at the first failure
+    even if ``results_file`` is set.
+    """
+    build_options, exec_options, test_options, reference = question
+    tests = test_options['tests']
+    if test_options['tests_file'] is not None:
+        tests = read_corpus(test_options['tests_file'])
+
+    try:
+        table, final_states = parse_transition_table(student_answer)
+        student = PDA(table=table, final_states=final_states, **build_options)
+    except Exception as e:
+        return str(e)
+
+    if reference is None:
+        correct = student
+    else:
+        correct = PDA(table=reference[0], final_states=reference[1],
+                **build_options)
+
+    for string in tests:
+        try:
+            student_accepts, steps = yield from simulate_in_slices(
+                    PDASimulator(student, string, **exec_options), slice_size)
+        except Exception as e:
+            result = failed_run(string, e)
+        else:
+            correct_accepts, _ = yield from simulate_in_slices(
+                    PDASimulator(correct, string, **exec_options), slice_size)
+            result = compare_answers(string, student_accepts, correct_accepts, steps)
+        if result['reason'] is not None:
+            return result['reason']
     return "Good"
 
 
+def simulate_in_slices(simulator, slice_size):
+    """Run ``simulator`` to completion, ``slice_size`` steps at a time,
+    yielding its footprint after each slice. Return a pair (result,
+    steps)."""
+    while True:
+        result = simulator.run_slice(slice_size)
+        if result is not None:
+            return (result, simulator.steps)
+        yield simulator.footprint()
+
+
 if __name__ == '__main__':
     import sys
     if len(sys.argv) == 1:
@@ -107,22 +370,15 @@ if __name__ == '__main__':
         option_str, correct_answer, student_answer = \
                 open(sys.argv[1]).read().split('---')
     else:
-        raise SystemExit('Usage: {} [TEST_FILE]'.format(sys.argv[0]))
-
-    # Parse the option string
-    build_options, exec_options, test_options = parse_options(option_str)
-
-    # Parse the PDAs
-    try:
-        run_student = parse_automaton(student_answer, build_options, exec_options)
-    except Exception as e:
-        print(e)
+        # Grade a whole cohort: the test file gives the options and the
+        # correct answer, and every other file holds one student's answer
+        option_str, correct_answer = open(sys.argv[1]).read().split('---')[:2]
+        paths = sys.argv[2:]
+        student_answers = [open(path).read() for path in paths]
+        for path, verdict in zip(paths,
+                grade_cohort(option_str, correct_answer, student_answers, paths)):
+            print('{}: {}'.format(path, verdict))
         raise SystemExit
 
-    if test_options['use_student_answer']:
-        run_correct = run_student
-    else:
-        run_correct = parse_automaton(correct_answer, build_options, exec_options)
-
-    # If everything's okay, run the tests
-    print(run_tests(run_student, run_correct, test_options))
+    question = prepare_question(option_str, correct_answer)
+    print(grade_question(question, student_answer))
@@ -0,0 +1,135 @@
+"""Grade many submissions at once, interleaving them in bounded slices.
+
+Each grading job is a generator, such as one returned by
+``grade_question_in_slices``. Every ``next()`` runs one slice of the
+job and yields its current memory footprint; the verdict is the
+generator's return value. The scheduler runs the jobs cooperatively on
+an asyncio event loop, so a single pathological submission can't hold
+up the rest, and cancels any job which runs too long or grows too
+large. A job which raises an exception fails on its own, without
+affecting the others.
+
+This module needs Python 3.5 or newer, and is not part of the merged
+``run_pda.py`` script.
+
+A copy of this module ships with the TM verifier, as ``scheduler.py``.
+
+Usage:
+
+    python3 -m pda.scheduler [--time-limit SECONDS] [--deadline SECONDS]
+        [--memory-limit SYMBOLS] [--concurrency JOBS]
+        TEST_FILE ANSWER_FILE...
+
+where ``TEST_FILE`` holds the options and correct answer, separated by
+``---``, and each ``ANSWER_FILE`` holds one student's answer.
+"""
+
+import argparse
+import asyncio
+import time
+
+from .driver import grade_question_in_slices, prepare_question
+
+
+TIME_LIMIT_EXCEEDED = 'time limit exceeded'
+DEADLINE_EXCEEDED = 'deadline exceeded'
+MEMORY_LIMIT_EXCEEDED = 'memory limit exceeded'
+GRADING_FAILED = 'error while grading: {}'
+
+
+def run_jobs(jobs, time_limit=None, deadline=None, memory_limit=None,
+        concurrency=None):
+    """Run grading jobs concurrently, and return a list of their
+    verdicts.
+
+    A job is cancelled if it spends more than ``time_limit`` seconds
+    running its own slices, if more than ``deadline`` seconds pass on
+    the clock after it starts, or if its footprint ever exceeds
+    ``memory_limit``. The deadline includes time spent waiting for other
+    jobs, so it bounds how long any submission takes to be graded. At
+    most ``concurrency`` jobs are in progress at once, and a job only
+    starts once there is room for it; if None, all of them are started
+    straight away.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run_all(
+                jobs, time_limit, deadline, memory_limit, concurrency))
+    finally:
+        loop.close()
+
+
+async def run_all(jobs, time_limit, deadline, memory_limit, concurrency):
+    if concurrency is None:
+        tasks = [run_job(job, time_limit, deadline, memory_limit)
+                for job in jobs]
+    else:
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [run_job_when_ready(semaphore, job, time_limit, deadline,
+                    memory_limit)
+                for job in jobs]
+    return await asyncio.gather(*tasks)
+
+
+async def run_job_when_ready(semaphore, job, time_limit, deadline, memory_limit):
+    async with semaphore:
+        return await run_job(job, time_limit, deadline, memory_limit)
+
+
+async def run_job(job, time_limit, deadline, memory_limit):
+    """Run a single job slice by slice, giving way to other jobs in
+    between, and return its verdict."""
+    started = time.monotonic()
+    elapsed = 0
+    try:
+        while True:
+            start = time.monotonic()
+            footprint = next(job)
+            end = time.monotonic()
+            elapsed += end - start
+            if time_limit is not None and elapsed > time_limit:
+                job.close()
+                return TIME_LIMIT_EXCEEDED
+            if deadline is not None and end - started > deadline:
+                job.close()
+                return DEADLINE_EXCEEDED
+            if memory_limit is not None and footprint > memory_limit:
+                job.close()
+                return MEMORY_LIMIT_EXCEEDED
+            await asyncio.sleep(0)
+    except StopIteration as e:
+        return e.value
+    except Exception as e:
+        job.close()
+        return GRADING_FAILED.format(e)
+
+
+def parse_arguments(argv):
+    """Parse the command line for ``__main__``."""
+    parser = argparse.ArgumentParser(
+            description='Grade many answers to one question concurrently.')
+    parser.add_argument('--time-limit', type=float, default=5,
+            help='seconds of running time per answer (default: %(default)s)')
+    parser.add_argument('--deadline', type=float, default=30,
+            help='seconds on the clock per answer, including time spent '
+                'waiting for others (default: %(default)s)')
+    parser.add_argument('--memory-limit', type=int, default=10**6,
+            help='largest footprint per answer, in symbols (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=10,
+            help='answers to grade at once (default: %(default)s)')
+    parser.add_argument('test_file')
+    parser.add_argument('answer_files', nargs='+')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    import sys
+    args = parse_arguments(sys.argv[1:])
+    option_str, correct_answer = open(args.test_file).read().split('---')[:2]
+    question = prepare_question(option_str, correct_answer)
+    jobs = [grade_question_in_slices(question, open(path).read())
+            for path in args.answer_files]
+    verdicts = run_jobs(jobs, time_limit=args.time_limit, deadline=args.deadline,
+            memory_limit=args.memory_limit, concurrency=args.concurrency)
+    for path, verdict in zip(args.answer_files, verdicts):
+        print('{}: {}'.format(path, verdict))
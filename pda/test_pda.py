@@ -1,6 +1,11 @@
+import json
+import sys
+
 import pytest
 
 import pda
+from pda.driver import grade_cohort, grade_question_in_slices, \
+        parse_automaton, prepare_question, read_corpus, run_tests
 
 
 # This PDA matches the language { 0^n 1^n | n : N }
@@ -78,6 +83,13 @@ pda_exponential = pda.PDA(
         set(),
         pda.FINAL_STATE)
 
+def test_run_slice():
+    simulator = pda.PDASimulator(pda_0n_1n, '000111')
+    assert simulator.run_slice(3) is None
+    assert simulator.steps == 3
+    assert simulator.run_slice(100) is True
+    assert simulator.steps == 8
+
 def test_iteration_limit():
     with pytest.raises(RuntimeError) as excinfo:
         pda.PDASimulator(pda_infinite_loop, '', max_iterations=100).run()
@@ -109,3 +121,171 @@ def test_unreachable_state():
                 {0},
                 pda.FINAL_STATE)
     assert 'unreachable' in str(excinfo.value)
+
+
+def test_read_corpus(tmpdir):
+    corpus = tmpdir.join('tests.txt')
+    corpus.write('0\n\n01\r\n0011')
+    assert list(read_corpus(str(corpus))) == ['0', '', '01', '0011']
+
+def test_read_corpus_empty(tmpdir):
+    corpus = tmpdir.join('tests.txt')
+    corpus.write('')
+    assert list(read_corpus(str(corpus))) == []
+
+
+def test_results_file(tmpdir):
+    build_options = dict(input_alpha='ab', stack_alpha='A', initial_stack='',
+            deterministic=False, accept_condition=pda.EMPTY_STACK)
+    exec_options = dict(max_iterations=100, max_configs=100, max_stack_size=100)
+    run_student = parse_automaton('(0, a, e) -> (0, A)', build_options, exec_options)
+    run_correct = parse_automaton('(0, a, e) -> (0, A) (0, b, A) -> (0, e)',
+            build_options, exec_options)
+    results = tmpdir.join('results.jsonl')
+    options = dict(tests=['', 'ab', 'a'], results_file=str(results))
+    assert run_tests(run_student, run_correct, options) == \
+            "Input 'ab' should be accepted."
+    lines = [json.loads(line) for line in results.readlines()]
+    assert [line['input'] for line in lines] == ['', 'ab', 'a']
+    assert [line['verdict'] for line in lines] == ['pass', 'fail', 'pass']
+    assert lines[1]['steps'] == 2
+
+
+def test_grade_cohort():
+    options = "input_alpha = 'ab'\naccept_condition = EMPTY_STACK\ntests = ['', 'a', 'ab', 'ba']"
+    correct = '(0, a, e) -> (0, A) (0, b, A) -> (0, e)'
+    students = [
+            correct,
+            '(0, a, e) -> (0, A)',
+            '(0, a, e) -> (0, A) (0, b, A) -> (0, e) (0, b, e) -> (0, B) (0, a, B) -> (0, e)',
+            'not a PDA',
+            ]
+    assert grade_cohort(options, correct, students) == [
+            "Good",
+            "Input 'ab' should be accepted.",
+            "Input 'ba' should be rejected.",
+            "invalid syntax: notaPDA",
+            ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler():
+    from pda.scheduler import run_jobs, MEMORY_LIMIT_EXCEEDED, TIME_LIMIT_EXCEEDED
+    options = """input_alpha = 'a'
+accept_condition = EMPTY_STACK
+max_iterations = 0
+max_stack_size = 0
+tests = ['', 'a', 'aa']"""
+    question = prepare_question(options, '(0, a, e) -> (0, e)')
+    answers = [
+            '(0, a, e) -> (0, e)',
+            '(0, a, e) -> (0, A)',
+            '(0, e, e) -> (0, e)',
+            '(0, e, e) -> (0, A)',
+            ]
+    jobs = [grade_question_in_slices(question, answer, slice_size=100)
+            for answer in answers]
+    assert run_jobs(jobs, time_limit=0.1, memory_limit=1000) == [
+            "Good",
+            "Input 'a' should be accepted.",
+            TIME_LIMIT_EXCEEDED,
+            MEMORY_LIMIT_EXCEEDED,
+            ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_isolates_errors():
+    from pda.scheduler import run_jobs
+    def broken_job():
+        yield 0
+        raise ValueError('oops')
+    question = prepare_question("input_alpha = 'a'\naccept_condition = EMPTY_STACK",
+            '(0, a, e) -> (0, e)')
+    jobs = [broken_job(), grade_question_in_slices(question, '(0, a, e) -> (0, e)')]
+    assert run_jobs(jobs) == ['error while grading: oops', "Good"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_interleaves():
+    from pda.scheduler import run_jobs
+    events = []
+    def record(name, job):
+        # Log the footprint after every slice, and when the job finishes
+        try:
+            while True:
+                footprint = next(job)
+                events.append((name, footprint))
+                yield footprint
+        except StopIteration as e:
+            events.append((name, 'done'))
+            return e.value
+    question = prepare_question(
+            "input_alpha = 'a'\naccept_condition = EMPTY_STACK\ntests = ['a']",
+            '(0, a, e) -> (0, e)')
+    # This one never reads its input, and pushes a symbol on every step
+    # until it runs out of iterations
+    slow = grade_question_in_slices(question, '(0, e, e) -> (0, A)')
+    cheap = grade_question_in_slices(question, '(0, a, e) -> (0, e)')
+    verdicts = run_jobs([record('slow', slow), record('cheap', cheap)])
+    assert verdicts == [
+            "On input 'a': iteration limit reached (is there an infinite loop?)",
+            "Good",
+            ]
+    # The cheap job should finish after only a little of the slow job
+    before_cheap = events[:events.index(('cheap', 'done'))]
+    assert all(name == 'slow' and footprint < 100
+            for name, footprint in before_cheap)
+
+
+def test_grade_cohort_results_file(tmpdir):
+    results = tmpdir.join('results.jsonl')
+    options = ("input_alpha = 'ab'\naccept_condition = EMPTY_STACK\n"
+            "tests = ['ab', 'a', '']\nresults_file = {!r}".format(str(results)))
+    correct = '(0, a, e) -> (0, A) (0, b, A) -> (0, e)'
+    assert grade_cohort(options, correct, [correct, '(0, a, e) -> (0, A)', 'bad'],
+            names=['good', 'wrong', 'bad']) == [
+                    "Good",
+                    "Input 'ab' should be accepted.",
+                    "invalid syntax: bad",
+                    ]
+    lines = [json.loads(line) for line in results.readlines()]
+    # Every test is run, even after the first failure
+    assert [(line['student'], line['input'], line['verdict']) for line in lines] == [
+            ('good', 'ab', 'pass'),
+            ('wrong', 'ab', 'fail'),
+            ('good', 'a', 'pass'),
+            ('wrong', 'a', 'pass'),
+            ('good', '', 'pass'),
+            ('wrong', '', 'pass'),
+            ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_deadline():
+    import time
+    from pda.scheduler import run_jobs, DEADLINE_EXCEEDED
+    def job():
+        for i in range(3):
+            time.sleep(0.05)
+            yield 0
+        return "Good"
+    # Each job runs for 0.15 seconds, which fits the deadline on its own,
+    # but not when they take turns
+    assert run_jobs([job(), job()], time_limit=1) == ["Good", "Good"]
+    assert run_jobs([job(), job()], time_limit=1, deadline=0.2) == \
+            [DEADLINE_EXCEEDED, DEADLINE_EXCEEDED]
+    # A job's deadline only starts once it gets its turn
+    assert run_jobs([job(), job()], deadline=0.2, concurrency=1) == \
+            ["Good", "Good"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_arguments():
+    from pda.scheduler import parse_arguments
+    args = parse_arguments(['--deadline', '2.5', '--concurrency', '3',
+            'question.txt', 'a.txt', 'b.txt'])
+    assert args.deadline == 2.5
+    assert args.concurrency == 3
+    assert args.time_limit == 5
+    assert args.test_file == 'question.txt'
+    assert args.answer_files == ['a.txt', 'b.txt']
@@ -0,0 +1,80 @@
+"""Build a self-contained verifier for a single question.
+
+A bundle holds the verifier precompiled to bytecode, along with the
+question's options, test suite and correct answer already parsed. This
+saves the quiz server from recompiling and reparsing everything on
+every submission.
+
+This lives apart from ``tm.py`` because the quiz server renders that
+file as a template, and the bundle template would confuse it.
+
+Usage:
+
+    python3 bundle.py QUESTION_FILE > BUNDLE
+
+where ``QUESTION_FILE`` holds the options and correct answer, separated
+by ``---``.
+"""
+
+from base64 import b64encode
+import marshal
+import os
+import sys
+
+from tm import prepare_question
+
+
+# Everything is embedded in base64, so that the quiz server's template
+# engine doesn't mistake any of it for a placeholder
+BUNDLE_TEMPLATE = '''#!/usr/bin/env python3
+from base64 import b64decode
+import marshal
+import sys
+
+CACHE_TAG = {cache_tag!r}
+CODE = {code!r}
+SOURCE = {source!r}
+QUESTION = {question!r}
+
+if sys.implementation.cache_tag == CACHE_TAG:
+    code = marshal.loads(b64decode(CODE))
+else:
+    # The bytecode is for a different interpreter, so compile from source
+    code = compile(b64decode(SOURCE), {filename!r}, 'exec')
+grader = {{'__name__': 'grader'}}
+exec(code, grader)
+
+if len(sys.argv) == 1:
+    # On the quiz server, this string constant will be replaced with
+    # the real input
+    student_answer = """{{{{ STUDENT_ANSWER | e('py') }}}}"""
+elif len(sys.argv) == 2:
+    # Read the student's answer from a file, for testing
+    student_answer = open(sys.argv[1]).read()
+else:
+    raise SystemExit('Usage: {{}} [ANSWER_FILE]'.format(sys.argv[0]))
+
+print(grader['grade_question'](marshal.loads(b64decode(QUESTION)), student_answer))
+'''
+
+
+def make_bundle(source, filename, option_str, correct_answer):
+    """Return the source of a bundle that grades answers to the given
+    question, using the verifier in ``source``."""
+    code = compile(source, filename, 'exec')
+    question = prepare_question(option_str, correct_answer)
+    return BUNDLE_TEMPLATE.format(
+            cache_tag=sys.implementation.cache_tag,
+            code=b64encode(marshal.dumps(code)),
+            source=b64encode(source.encode('utf-8')),
+            question=b64encode(marshal.dumps(question)),
+            filename=filename)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        raise SystemExit('Usage: {} QUESTION_FILE'.format(sys.argv[0]))
+    option_str, correct_answer = open(sys.argv[1]).read().split('---')[:2]
+    grader = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tm.py')
+    sys.stdout.write(make_bundle(open(grader).read(), 'tm.py',
+            option_str, correct_answer))
@@ -0,0 +1,257 @@
+import json
+import marshal
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import tm
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_question(option_str, correct_answer=''):
+    return tm.prepare_question(option_str, correct_answer)
+
+
+# This TM has no column for the symbol '1', so it crashes when it reads one
+tm_narrow = '[[(0,0,R),(a,_,N)]]'
+
+# This TM accepts every binary string
+tm_accept_all = '[[(0,0,R),(0,1,R),(a,_,N)]]'
+
+
+def test_use_student_answer_crash():
+    question = make_question("tests = ['0', '1']\nuse_student_answer = True")
+    assert tm.grade_question(question, tm_narrow) == \
+            "There's an error in the automata representation."
+    assert tm.finish(tm.grade_question_in_slices(question, tm_narrow)) == \
+            "There's an error in the automata representation."
+    assert tm.grade_cohort("tests = ['0', '1']\nuse_student_answer = True", '',
+            [tm_narrow, tm_accept_all]) == [
+                    "There's an error in the automata representation.",
+                    "Good",
+                    ]
+
+
+def test_broken_reference():
+    # Crashes in the question's own answer should not be blamed on the
+    # student
+    question = make_question("tests = ['1']", tm_narrow)
+    with pytest.raises(AssertionError):
+        tm.grade_question(question, tm_accept_all)
+    with pytest.raises(AssertionError):
+        tm.finish(tm.grade_question_in_slices(question, tm_accept_all))
+    with pytest.raises(AssertionError):
+        tm.grade_cohort("tests = ['1']", tm_narrow, [tm_accept_all])
+
+
+def test_step_budget():
+    # The reference halts after reading the input and one blank, so a
+    # looping student gets step_factor * 3 + step_slack steps
+    options = tm.parse_options("tests = ['01']\nstep_factor = 3\nstep_slack = 7")
+    [result] = tm.evaluate_tests(tm.parse(tm_loop), tm.parse(tm_accept_all), options)
+    assert result['verdict'] == 'limit'
+    assert result['steps'] == 3*3 + 7
+    # But never more than max_steps
+    options = tm.parse_options("tests = ['01']\nstep_slack = 1000")
+    [result] = tm.evaluate_tests(tm.parse(tm_loop), tm.parse(tm_accept_all), options)
+    assert result['steps'] == 500
+    assert tm.run_tests(tm.parse(tm_loop), tm.parse(tm_accept_all), options) == \
+            "TM takes too many steps for input '01'."
+
+
+def test_read_corpus(tmpdir):
+    corpus = tmpdir.join('tests.txt')
+    corpus.write('0\n\n01\r\n0011')
+    assert list(tm.read_corpus(str(corpus))) == ['0', '', '01', '0011']
+
+def test_read_corpus_empty(tmpdir):
+    corpus = tmpdir.join('tests.txt')
+    corpus.write('')
+    assert list(tm.read_corpus(str(corpus))) == []
+
+
+def test_results_file(tmpdir):
+    corpus = tmpdir.join('tests.txt')
+    corpus.write('0\n\n1\n')
+    results = tmpdir.join('results.jsonl')
+    question = make_question(
+            'tests_file = {!r}\nresults_file = {!r}'.format(str(corpus), str(results)),
+            tm_accept_all)
+    assert tm.grade_question(question, tm_narrow) == \
+            "There's an error in the automata representation."
+    lines = [json.loads(line) for line in results.readlines()]
+    assert [line['input'] for line in lines] == ['0', '', '1']
+    assert [line['verdict'] for line in lines] == ['pass', 'pass', 'error']
+    assert [line['steps'] for line in lines] == [2, 1, None]
+
+
+# This TM never halts
+tm_loop = '[[(0,0,N),(0,1,N),(0,_,N)]]'
+
+# This TM rejects every string
+tm_reject_all = '[[(0,0,R),(0,1,R),(r,_,N)]]'
+
+
+def test_grade_cohort():
+    options = "tests = ['', '0', '1']\nmax_steps = 1000"
+    assert tm.grade_cohort(options, tm_accept_all,
+            [tm_accept_all, tm_narrow, tm_loop, tm_reject_all, 'not a TM']) == [
+                    "Good",
+                    "There's an error in the automata representation.",
+                    "TM takes too many steps for input ''.",
+                    "Input '' should be accepted.",
+                    "There's a lexical error in the TM representation.",
+                    ]
+
+def test_grade_cohort_results_file(tmpdir):
+    results = tmpdir.join('results.jsonl')
+    options = "tests = ['', '0']\nresults_file = {!r}".format(str(results))
+    assert tm.grade_cohort(options, tm_accept_all,
+            [tm_accept_all, tm_reject_all, 'not a TM'],
+            names=['good', 'wrong', 'bad']) == [
+                    "Good",
+                    "Input '' should be accepted.",
+                    "There's a lexical error in the TM representation.",
+                    ]
+    lines = [json.loads(line) for line in results.readlines()]
+    # Every test is run, even after the first failure
+    assert [(line['student'], line['input'], line['verdict']) for line in lines] == [
+            ('good', '', 'pass'),
+            ('wrong', '', 'fail'),
+            ('good', '0', 'pass'),
+            ('wrong', '0', 'fail'),
+            ]
+
+def test_cohort_matches_run_tests():
+    options = tm.parse_options("tests = ['', '0', '1', '01']")
+    correct_table = tm.parse(tm_accept_all)
+    student_tables = [tm.parse(answer)
+            for answer in [tm_accept_all, tm_narrow, tm_loop, tm_reject_all]]
+    assert tm.run_cohort(student_tables, correct_table, options) == \
+            [tm.run_tests(table, correct_table, options) for table in student_tables]
+
+
+def test_prepare_question_is_serialisable():
+    question = make_question("tests = ['', '0']\nhelper = lambda: None", tm_accept_all)
+    assert marshal.loads(marshal.dumps(question)) == question
+    assert tm.grade_question(question, tm_reject_all) == \
+            "Input '' should be accepted."
+
+
+def test_grade_question_syntax_error():
+    question = make_question("tests = ['']", tm_accept_all)
+    assert tm.grade_question(question, 'not a TM') == \
+            "There's a lexical error in the TM representation."
+
+
+def test_bundle(tmpdir):
+    question_file = tmpdir.join('question.txt')
+    question_file.write("tests = ['', '0', '1']\n---\n" + tm_accept_all)
+    bundle = tmpdir.join('question-bundle.py')
+    bundle.write(subprocess.check_output(
+            [sys.executable, os.path.join(HERE, 'bundle.py'), str(question_file)]),
+            mode='wb')
+    for answer, expected in [
+            (tm_accept_all, "Good"),
+            ('not a TM', "There's a lexical error in the TM representation."),
+            (tm_reject_all, "Input '' should be accepted."),
+            ]:
+        answer_file = tmpdir.join('answer.txt')
+        answer_file.write(answer)
+        output = subprocess.check_output(
+                [sys.executable, str(bundle), str(answer_file)])
+        assert output.decode().strip() == expected
+    # Template placeholders must only appear where the server fills them in
+    source = bundle.read()
+    assert source.count('{{') == 1
+    # On another interpreter, the bundle compiles the embedded source
+    bundle.write(re.sub(r"(?m)^CACHE_TAG = .*$", "CACHE_TAG = 'elsewhere'", source))
+    output = subprocess.check_output([sys.executable, str(bundle), str(answer_file)])
+    assert output.decode().strip() == "Input '' should be accepted."
+
+
+def test_server_placeholders():
+    # The quiz server renders tm.py as a template, so it must not contain
+    # anything else that looks like a tag
+    source = open(os.path.join(HERE, 'tm.py')).read()
+    assert re.findall(r'\{\{.*?\}\}', source) == [
+            "{{ TEST.stdin | e('py') }}",
+            "{{ TEST.testcode | e('py') }}",
+            "{{ STUDENT_ANSWER | e('py') }}",
+            ]
+    assert len(re.findall(r'\{[{%#]', source)) == 3
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_isolates_errors():
+    from scheduler import run_jobs
+    def broken_job():
+        yield 0
+        raise ValueError('oops')
+    question = make_question("tests = ['', '0']", tm_accept_all)
+    jobs = [broken_job(), tm.grade_question_in_slices(question, tm_accept_all)]
+    assert run_jobs(jobs) == ['error while grading: oops', "Good"]
+
+
+def test_simulate_in_slices():
+    table = tm.parse(tm_accept_all)
+    slices = tm.simulate_in_slices(table, '0101', 100, 2)
+    assert next(slices) == 4
+    assert next(slices) == 4
+    with pytest.raises(StopIteration) as excinfo:
+        next(slices)
+    assert excinfo.value.value == ((-1, '0101'), 5)
+    assert tm.simulate_with_steps(table, '0101', 100) == ((-1, '0101'), 5)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_limits():
+    from scheduler import run_jobs, MEMORY_LIMIT_EXCEEDED, TIME_LIMIT_EXCEEDED
+    question = make_question(
+            "tests = ['1']\nmax_steps = 10**9\nuse_student_answer = True")
+    # This TM walks right forever, growing the tape as it goes
+    tm_walk = '[[(0,0,R),(0,1,R),(0,_,R)]]'
+    jobs = [tm.grade_question_in_slices(question, answer, slice_size=100)
+            for answer in [tm_accept_all, tm_narrow, tm_loop, tm_walk]]
+    assert run_jobs(jobs, time_limit=0.2, memory_limit=1000) == [
+            "Good",
+            "There's an error in the automata representation.",
+            TIME_LIMIT_EXCEEDED,
+            MEMORY_LIMIT_EXCEEDED,
+            ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_deadline():
+    from scheduler import run_jobs, DEADLINE_EXCEEDED
+    # The reference never halts, so every job runs until it is cancelled
+    question = make_question("tests = ['']\nmax_steps = 10**9", tm_loop)
+    jobs = [tm.grade_question_in_slices(question, answer, slice_size=100)
+            for answer in [tm_loop, tm_accept_all]]
+    assert run_jobs(jobs, deadline=0.2) == [DEADLINE_EXCEEDED, DEADLINE_EXCEEDED]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async/await')
+def test_scheduler_arguments():
+    from scheduler import parse_arguments
+    args = parse_arguments(['--memory-limit', '500', 'question.txt', 'a.txt'])
+    assert args.memory_limit == 500
+    assert args.deadline == 30
+    assert args.answer_files == ['a.txt']
+
+
+PDA_SCHEDULER = os.path.join(HERE, os.pardir, 'pda', 'pda', 'scheduler.py')
+
+@pytest.mark.skipif(not os.path.exists(PDA_SCHEDULER),
+        reason='PDA verifier not checked out alongside')
+def test_scheduler_matches_pda():
+    def body(path):
+        # Everything after the imports
+        source = open(path).read()
+        return source[source.index('\n\n\nTIME_LIMIT_EXCEEDED'):]
+    assert body(os.path.join(HERE, 'scheduler.py')) == body(PDA_SCHEDULER)
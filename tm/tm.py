@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
+from random import Random
+import json
+import mmap
 import re
 import sys
 
@@ -65,72 +68,400 @@ def strings_of_length(upto, alpha):
     return result
 
 
-def simulate(table, right, max_steps=500):
+def simulate_with_steps(table, right, max_steps):
+    """Run the machine for at most ``max_steps`` steps.
+
+    Return a pair (result, steps), where result is the pair (state,
+    tape) once the machine halts, and steps is the number of transitions
+    taken. If the machine does not halt in time, the result is None.
+    """
+    return finish(simulate_in_slices(table, right, max_steps, max_steps))
+
+
+def simulate_in_slices(table, right, max_steps, slice_size):
+    """Like ``simulate_with_steps``, but as a generator which runs the
+    machine at most ``slice_size`` steps at a time.
+
+    After each slice, yield the length of the tape so far, as a rough
+    measure of memory use. The pair (result, steps) is the generator's
+    return value.
+    """
     state = 0
     left = ''
-    while state >= 0 and max_steps > 0:
-        max_steps -= 1
-        symbol = '_' if len(right) == 0 else right[0]
-        read = -1 if symbol == '_' else int(symbol)
-        assert read < len(table[state]) - 1
-        state, write, move = table[state][read]
-        symbol = '_' if write == -1 else str(write)
-        right = symbol + right[1:]
-        if move == -1:
-            symbol = '_' if len(left) == 0 else left[-1]
-            right = symbol + right
-            left = left[:-1]
-        elif move == 1:
+    steps = 0
+    while True:
+        limit = min(max_steps, steps + slice_size)
+        while state >= 0 and steps < limit:
+            steps += 1
             symbol = '_' if len(right) == 0 else right[0]
-            left = left + symbol
-            right = right[1:]
-    if max_steps <= 0:
-        return None
-    return (state, (left + right).strip('_'))
+            read = -1 if symbol == '_' else int(symbol)
+            assert read < len(table[state]) - 1
+            state, write, move = table[state][read]
+            symbol = '_' if write == -1 else str(write)
+            right = symbol + right[1:]
+            if move == -1:
+                symbol = '_' if len(left) == 0 else left[-1]
+                right = symbol + right
+                left = left[:-1]
+            elif move == 1:
+                symbol = '_' if len(right) == 0 else right[0]
+                left = left + symbol
+                right = right[1:]
+        if state < 0 or steps >= max_steps:
+            break
+        yield len(left) + len(right)
+    if state >= 0:
+        return (None, steps)
+    return ((state, (left + right).strip('_')), steps)
+
+
+def finish(generator):
+    """Run a generator to completion, and return its return value.
+
+    >>> def countdown(n):
+    ...     while n > 0:
+    ...         yield n
+    ...         n -= 1
+    ...     return 'liftoff'
+    >>> finish(countdown(3))
+    'liftoff'
+    """
+    try:
+        while True:
+            next(generator)
+    except StopIteration as e:
+        return e.value
+
+
+def step_budget(correct_answer, correct_steps, options):
+    """Return the number of steps the student's machine may take on an
+    input, given how the reference machine fared on the same input.
+
+    >>> options = dict(max_steps=1000, step_factor=2, step_slack=10)
+    >>> step_budget((-1, ''), 40, options)
+    90
+    >>> step_budget((-1, ''), 800, options)
+    1000
+    >>> step_budget(None, 1000, options)
+    1000
+    """
+    if correct_answer is None:
+        # The reference doesn't halt either, so give the student the
+        # whole budget before declaring a match
+        return options['max_steps']
+    return min(options['max_steps'],
+            options['step_factor'] * correct_steps + options['step_slack'])
+
+
+DEFAULT_OPTIONS = dict(
+        ignore_output=False,
+        use_student_answer=False,
+        input_alpha='01',
+        max_steps=500,
+        step_factor=2,
+        step_slack=100,
+        tests_file=None,
+        results_file=None,
+        )
 
 
 def parse_options(option_str):
     """Parse an option string into a dictionary. The string is
     interpreted as Python code."""
-    options = dict(
-            ignore_output=False,
-            use_student_answer=False,
-            input_alpha='01'
-            )
+    options = dict(DEFAULT_OPTIONS)
     exec(option_str, globals(), options)
-    if 'tests' not in options:
+    if options['tests_file'] is not None:
+        # Stream the tests from disk, rather than loading them all
+        options['tests'] = read_corpus(options['tests_file'])
+    elif 'tests' not in options:
         options['tests'] = strings_of_length(upto=9, alpha=options['input_alpha'])
         # Test long strings
-        for char in input_alpha:
+        for char in options['input_alpha']:
             options['tests'].append(30*char)
         # Test a few "random" strings
         # We initialize the generator with a constant seed, to ensure
         # consistency between runs
         generator = Random(0)
         for i in range(10):
-            s = ''.join(generator.choice(input_alpha) for _ in range(30))
+            s = ''.join(generator.choice(options['input_alpha']) for _ in range(30))
             options['tests'].append(s)
     return options
 
 
-def run_tests(student_table, correct_table, options):
+def read_corpus(path):
+    """Yield the strings in a test corpus file, one per line.
+
+    The file is memory-mapped and read lazily, so it may be much larger
+    than would comfortably fit in a list. A blank line stands for the
+    empty string.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped, but they have no tests anyway
+            return
+        with data:
+            for line in iter(data.readline, b''):
+                yield line.rstrip(b'\r\n').decode('utf-8')
+
+
+def evaluate_tests(student_table, correct_table, options):
+    """Run the student's TM against the correct one on every test,
+    yielding the result of ``check_input`` for each."""
     for string in options['tests']:
+        # Run the reference first, so that we know how many steps the
+        # student's machine should reasonably need. With
+        # use_student_answer, the reference is the student's own machine,
+        # so it may crash too.
+        try:
+            correct = simulate_with_steps(correct_table, string, options['max_steps'])
+        except Exception:
+            if correct_table is not student_table:
+                raise
+            yield failed_run(string)
+            continue
+        yield check_input(student_table, correct, string, options)
+
+
+def check_input(student_table, correct, string, options):
+    """Run the student's TM on a single string, and compare it with
+    ``correct``, the result of running the reference on that string.
+
+    Return a dictionary giving the verdict (``'pass'``, ``'fail'``,
+    ``'limit'`` or ``'error'``), the number of steps the student's TM
+    took, and the reason for failure (or None).
+    """
+    correct_answer, correct_steps = correct
+    budget = step_budget(correct_answer, correct_steps, options)
+    try:
+        student_answer, steps = simulate_with_steps(student_table, string, budget)
+    except Exception:
+        return failed_run(string)
+    return compare_answers(string, student_answer, correct, steps, options)
+
+
+def failed_run(string):
+    """Return the result for a student's TM which crashed on ``string``."""
+    return dict(input=string, verdict='error', steps=None,
+            reason="There's an error in the automata representation.")
+
+
+def compare_answers(string, student_answer, correct, steps, options):
+    """Return the result for a student's TM which ran on ``string``
+    without crashing."""
+    correct_answer, _ = correct
+    if student_answer == correct_answer:
+        reason = None
+    elif student_answer is None:
+        reason = "TM takes too many steps for input '" + string + "'."
+    elif correct_answer is None:
+        reason = "TM should not terminate for input '" + string + "'."
+    elif student_answer[0] == -1 and correct_answer[0] == -2:
+        reason = "Input '" + string + "' should be rejected."
+    elif student_answer[0] == -2 and correct_answer[0] == -1:
+        reason = "Input '" + string + "' should be accepted."
+    elif not options['ignore_output'] and student_answer[1] != correct_answer[1]:
+        reason = "TM computes the wrong result for input '" + string + "'."
+    else:
+        reason = None
+    if reason is None:
+        verdict = 'pass'
+    elif student_answer is None:
+        verdict = 'limit'
+    else:
+        verdict = 'fail'
+    return dict(input=string, verdict=verdict, steps=steps, reason=reason)
+
+
+def run_tests(student_table, correct_table, options):
+    """Return the reason for the first failing test, or "Good" if
+    everything passes.
+
+    If the ``results_file`` option is set, every test is run regardless,
+    and the result for each is written to that file as a line of JSON.
+    """
+    results = evaluate_tests(student_table, correct_table, options)
+    if options['results_file'] is None:
+        for result in results:
+            if result['reason'] is not None:
+                return result['reason']
+        return "Good"
+    first_failure = None
+    with open(options['results_file'], 'w') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+            if first_failure is None:
+                first_failure = result['reason']
+    return first_failure or "Good"
+
+
+def run_cohort(student_tables, correct_table, options, names=None):
+    """Grade many students' TMs against the same tests in a single pass.
+
+    The tests are read once, and the correct TM is run once per string
+    and shared between students. If ``correct_table`` is None, each
+    student's TM is compared against itself.
+
+    If the ``results_file`` option is set, every student is run on every
+    test, and each result is written to that file as a line of JSON.
+    Its ``student`` field is taken from ``names``, which defaults to the
+    student's position in ``student_tables``.
+
+    Return a list with the result of ``run_tests`` for each student.
+    """
+    if names is None:
+        names = list(range(len(student_tables)))
+    verdicts = [None] * len(student_tables)
+    pending = dict(enumerate(student_tables))
+    results = None
+    if options['results_file'] is not None:
+        results = open(options['results_file'], 'w')
+    try:
+        for string in options['tests']:
+            if not pending:
+                break
+            if correct_table is not None:
+                correct = simulate_with_steps(correct_table, string, options['max_steps'])
+            for index, student_table in list(pending.items()):
+                result = None
+                if correct_table is None:
+                    try:
+                        correct = simulate_with_steps(
+                                student_table, string, options['max_steps'])
+                    except Exception:
+                        result = failed_run(string)
+                if result is None:
+                    result = check_input(student_table, correct, string, options)
+                if results is not None:
+                    result['student'] = names[index]
+                    results.write(json.dumps(result) + '\n')
+                if result['reason'] is not None:
+                    if verdicts[index] is None:
+                        verdicts[index] = result['reason']
+                    if results is None:
+                        # The first failure is all we need to report
+                        del pending[index]
+    finally:
+        if results is not None:
+            results.close()
+    return [verdict or "Good" for verdict in verdicts]
+
+
+def grade_cohort(option_str, correct_answer, student_answers, names=None):
+    """Parse the options and correct answer once, then grade every
+    answer in ``student_answers`` against them. ``names`` identifies
+    each student in the ``results_file``, as for ``run_cohort``.
+
+    Return a list of verdicts, one for each student.
+    """
+    if names is None:
+        names = list(range(len(student_answers)))
+    options = parse_options(option_str)
+
+    verdicts = [None] * len(student_answers)
+    student_tables = {}
+    for index, student_answer in enumerate(student_answers):
+        try:
+            student_tables[index] = parse(student_answer)
+        except Exception as e:
+            verdicts[index] = str(e)
+
+    if options['use_student_answer']:
+        correct_table = None
+    else:
+        correct_table = parse(correct_answer)
+
+    indices = sorted(student_tables)
+    results = run_cohort([student_tables[index] for index in indices],
+            correct_table, options, [names[index] for index in indices])
+    for index, verdict in zip(indices, results):
+        verdicts[index] = verdict
+    return verdicts
+
+
+def prepare_question(option_str, correct_answer):
+    """Parse the options and correct answer for a question.
+
+    The result contains only plain data, so it can be serialised with
+    ``marshal`` and embedded in a bundle. Pass it to ``grade_question``
+    to grade a student's answer.
+    """
+    options = parse_options(option_str)
+    if options['tests_file'] is not None:
+        # The corpus is streamed when grading, not stored in the question
+        options['tests'] = None
+    else:
+        options['tests'] = list(options['tests'])
+    if options['use_student_answer']:
+        correct_table = None
+    else:
+        correct_table = parse(correct_answer)
+    # Only keep the options we know about; anything else the question
+    # writer defined (e.g. helper functions) can't be serialised
+    options = {key: options[key] for key in list(DEFAULT_OPTIONS) + ['tests']}
+    return (options, correct_table)
+
+
+def grade_question(question, student_answer):
+    """Grade a student's answer against a question returned by
+    ``prepare_question``, and return the verdict."""
+    options, correct_table = question
+    if options['tests_file'] is not None:
+        options['tests'] = read_corpus(options['tests_file'])
+
+    try:
+        student_table = parse(student_answer)
+    except Exception as e:
+        return str(e)
+
+    if correct_table is None:
+        correct_table = student_table
+
+    return run_tests(student_table, correct_table, options)
+
+
+def grade_question_in_slices(question, student_answer, slice_size=1000):
+    """Like ``grade_question``, but as a generator which runs the
+    machines at most ``slice_size`` steps at a time.
+
+    After each slice, yield the length of the running machine's tape.
+    The verdict is the generator's return value. Unlike
+    ``grade_question``, this stops at the first failure even if
+    ``results_file`` is set.
+    """
+    options, correct_table = question
+    tests = options['tests']
+    if options['tests_file'] is not None:
+        tests = read_corpus(options['tests_file'])
+
+    try:
+        student_table = parse(student_answer)
+    except Exception as e:
+        return str(e)
+
+    if correct_table is None:
+        correct_table = student_table
+
+    for string in tests:
+        try:
+            correct = yield from simulate_in_slices(
+                    correct_table, string, options['max_steps'], slice_size)
+        except Exception:
+            # The reference may be the student's own machine
+            if correct_table is not student_table:
+                raise
+            return failed_run(string)['reason']
+        budget = step_budget(correct[0], correct[1], options)
         try:
-            student_answer = simulate(student_table, string)
+            student_answer, steps = yield from simulate_in_slices(
+                    student_table, string, budget, slice_size)
         except Exception:
-            return "There's an error in the automata representation."
-        correct_answer = simulate(correct_table, string)
-        if student_answer != correct_answer:
-            if student_answer is None:
-                return "TM takes too many steps for input '" + string + "'."
-            elif correct_answer is None:
-                return "TM should not terminate for input '" + string + "'."
-            elif student_answer[0] == -1 and correct_answer[0] == -2:
-                return "Input '" + string + "' should be rejected."
-            elif student_answer[0] == -2 and correct_answer[0] == -1:
-                return "Input '" + string + "' should be accepted."
-            elif not options['ignore_output'] and student_answer[1] != correct_answer[1]:
-                return "TM computes the wrong result for input '" + string + "'."
+            result = failed_run(string)
+        else:
+            result = compare_answers(string, student_answer, correct, steps, options)
+        if result['reason'] is not None:
+            return result['reason']
     return "Good"
 
 
@@ -146,18 +477,22 @@ if __name__ == '__main__':
         option_str, correct_answer, student_answer = \
                 open(sys.argv[1]).read().split('---')
     else:
-        raise SystemExit('Usage: {} [TEST_FILE]'.format(sys.argv[0]))
-
-    options = parse_options(option_str)
+        # Grade a whole cohort: the test file gives the options and the
+        # correct answer, and every other file holds one student's answer
+        option_str, correct_answer = open(sys.argv[1]).read().split('---')[:2]
+        paths = sys.argv[2:]
+        student_answers = [open(path).read() for path in paths]
+        for path, verdict in zip(paths,
+                grade_cohort(option_str, correct_answer, student_answers, paths)):
+            print('{}: {}'.format(path, verdict))
+        raise SystemExit
 
+    # Syntax errors in the student's answer have always been reported
+    # on stderr, with a failing exit status
     try:
-        student_table = parse(student_answer)
+        parse(student_answer)
     except Exception as e:
         raise SystemExit(e)
 
-    if options['use_student_answer']:
-        correct_table = student_table
-    else:
-        correct_table = parse(correct_answer)
-
-    print(run_tests(student_table, correct_table, options))
+    question = prepare_question(option_str, correct_answer)
+    print(grade_question(question, student_answer))